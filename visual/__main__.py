@@ -1,17 +1,29 @@
 from __future__ import annotations
 
+import argparse
+import ast
 import atexit
+import functools
 import itertools
+import json
+import logging
+import os
+import re
+import select
+import shutil
+import signal
 import sys
 import termios
+import time
 from dataclasses import dataclass
 from enum import Enum
-from typing import Iterable, Iterator, List, Optional, TypeVar
+from types import CodeType
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
 
 import readchar
 from profilehooks import profile
 
-from visual import ansi, utils
+from visual import ansi, complete, dependencies, export, gapbuffer, log, plot, server, session, store, terminal, utils, wrap
 
 # editing
 SKIP_DENOMINATOR = False  # maple, mathquill: True
@@ -22,6 +34,32 @@ FRAC_INS_METHOD = "maple"  # possible values: maple, split, empty
 FRAC_PADDING = 1
 FRAC_SHORTER_ENDS = True
 VIRTUAL_CURSOR = True
+LINE_BREAKING = True  # break expressions wider than the terminal after the operators, otherwise scroll horizontally
+
+# frame scheduling
+FRAME_BUDGET = 0.010  # seconds, the panels below the equation are computed later if the frame takes longer
+
+# completion (TAB accepts the first candidate)
+COMPLETIONS = 8  # number of candidates shown below the equation
+
+# evaluation
+INCREMENTAL_EVAL = True  # evaluate rows, fractions and parenthesized groups separately and cache the values
+
+# plotting (expressions in one free variable, requires numpy)
+PLOT_RANGE = (-10.0, 10.0)
+PLOT_SAMPLES = 1_000_000
+PLOT_WIDTH = 80
+PLOT_HEIGHT = 20
+
+# debug tracing (logging.WARNING or higher disables it, the disabled messages are not even formatted)
+LOG_LEVEL = logging.DEBUG
+
+# profiling of `display()` (the report is printed to stdout at exit, it would end up in the --export output)
+PROFILE = False
+
+# bracketed paste (the whole pasted text arrives as a single key, see `Expression.insert()`)
+PASTE_START = "\033[200~"
+PASTE_END = "\033[201~"
 
 # syntax highlighting colors
 NUM_COLOR = ansi.red
@@ -77,9 +115,20 @@ def obj_index(iterable: Iterable[T], obj: T) -> int:  # todo: use Expression.rep
 
 
 
-def eprint(*values: object, sep: str = ' ', end: str = '\n'):
-	print(*values, sep, end, file=sys.stderr)
-	sys.stderr.flush()
+def profiled(function: Callable[..., T]) -> Callable[..., T]:
+	"""`profile` the function if `PROFILE` is enabled."""
+	return profile(function) if PROFILE else function
+
+
+
+def is_edit(key: str) -> bool:
+	"""Whether the keystroke can change the code (as opposed to only moving the cursor)."""
+	return key.isprintable() or key in (readchar.key.BACKSPACE, readchar.key.TAB)
+
+
+
+logger = logging.getLogger("equed")
+KEY_NAMES = {value: name for name, value in vars(readchar.key).items() if isinstance(value, str) and not name.startswith("_")}
 
 
 
@@ -148,6 +197,21 @@ def align_space(expr_width: int, target_width: int) -> int:
 
 
 
+def color_line(line: str, colors: List[str]) -> str:
+	return "".join(f"{pixel}{ch}{ansi.reset}" for ch, pixel in zip(line, colors))
+
+
+
+LATEX_ESCAPES = {"\\": r"\backslash ", "{": r"\{", "}": r"\}", "_": r"\_", "#": r"\#", "$": r"\$", "%": r"\%", "&": r"\&", "~": r"\sim ", "*": r"\cdot ", "^": r"\oplus "}
+EXPONENT = re.compile(r"\s*([-+]?\s*[\w.]+)")  # the operand of `**` in the same text, see `Text.latex()`
+
+
+
+def latex_escape(s: str) -> str:
+	return "".join(LATEX_ESCAPES.get(ch, ch) for ch in s)
+
+
+
 @dataclass(frozen=True)
 class RenderOutput:
 	lines: List[str]
@@ -166,7 +230,185 @@ class RenderOutput:
 
 
 
+@dataclass(frozen=True, eq=False)  # compared by identity (see `Panel.key`)
+class Frame:
+	lines: List[str]  # colored and cropped to the terminal width
+	colors: List[List[str]]  # cropped, not colored
+	cursor: ScreenOffset
+	width: int  # terminal width
+
+
+
+@dataclass(frozen=True, eq=False)
+class Unit:
+	"""Part of the code evaluated on its own, see `split()`."""
+	code: str  # the fractions and the groups substituted by the names
+	compiled: Optional[CodeType]
+	values: Dict[str, Callable[[], object]]  # name -> value of the substituted fraction or group
+	
+	
+	def evaluate(self) -> object:
+		return utils.evaluate(self.compiled, self.values)
+
+
+
+def compose(r: RenderOutput, width: int) -> Frame:
+	if not r.cursor:
+		raise ValueError("cursor is missing")
+	
+	lines, colors = r.lines, r.colors
+	if VIRTUAL_CURSOR:
+		# add a single-space border to the right edge
+		lines = [line + " " for line in lines]
+		colors = [color + [ansi.reset] for color in colors]
+	
+	# scroll horizontally if the expression is wider than the terminal, keep the cursor in the middle
+	offset = max(0, min(r.cursor.col - width // 2, len(lines[0]) - width))
+	lines = [line[offset:offset + width] for line in lines]
+	colors = [color[offset:offset + width] for color in colors]
+	cursor = r.cursor.left(offset)
+	
+	output = []
+	for row, (line, color) in enumerate(zip(lines, colors)):
+		assert len(line) == len(color)
+		colored_line = []
+		
+		for col, (ch, pixel) in enumerate(zip(line, color)):
+			if VIRTUAL_CURSOR and row == cursor.row and col == cursor.col:
+				pixel = f"{pixel}{ansi.inv}"
+			
+			colored_line.append(f"{pixel}{ch}{ansi.reset}")
+		
+		output.append("".join(colored_line))
+	
+	return Frame(output, colors, cursor, width)
+
+
+
+def crop(r: RenderOutput, start: int, end: int) -> RenderOutput:
+	"""Columns from `start` to `end` of the output, keeps the cursor only if it's there (or at the very end)."""
+	cursor = r.cursor
+	if cursor and not (start <= cursor.col < end or cursor.col == end == r.width):
+		cursor = None
+	
+	lines = [line[start:end] for line in r.lines]
+	colors = [color[start:end] for color in r.colors]
+	return RenderOutput(lines, colors, r.baseline, end - start, cursor and cursor.left(start))
+
+
+
+def join_line(rr: List[RenderOutput], line_index: int) -> Tuple[str, List[str]]:
+	"""Join the `line_index`-th line of all the (baseline aligned) outputs, lines and colors."""
+	line = "".join(str_align(r.lines[line_index] if len(r.lines) > line_index else "", r.width) for r in rr)
+	colors = flatten(list_align(r.colors[line_index] if len(r.colors) > line_index else [""], r.width) for r in rr)
+	return line, colors
+
+
+
+# hash-consing: identical subtrees (ignoring the cursor) share the same structure id, see `Expression.structure()`
+STRUCTURES: utils.LRU[Tuple[object, ...], int] = utils.LRU(100_000)  # structure -> id
+RENDERS: utils.LRU[int, RenderOutput] = utils.LRU(10_000)  # id -> render (of a subtree without the cursor)
+CODES: utils.LRU[int, str] = utils.LRU(10_000)  # id -> code
+VALUES: utils.LRU[int, Tuple[object, Optional[Exception]]] = utils.LRU(10_000)  # id -> (value, error) of a group
+UNITS: utils.LRU[Tuple[str, ...], Tuple[object, Optional[Exception]]] = utils.LRU(10_000)  # code, names -> compiled
+structure_ids = itertools.count()
+
+# names for completion, the ones defined by the expressions are added by the main loop
+completer = complete.Completer()
+
+
+
+def intern(structure: Tuple[object, ...]) -> int:
+	id = STRUCTURES.get(structure)
+	return id if id is not None else STRUCTURES.put(structure, next(structure_ids))
+
+
+
+def grouping(code: List[str]) -> bool:
+	"""Whether an opening paren following the code groups (the other ones call, conservatively after any name)."""
+	for piece in reversed(code):
+		if piece.strip():
+			return piece.rstrip()[-1] in "+-*/%@&|^~<>=!,([{:"
+	return True
+
+
+
+def closing(items: List[Expression], start: int) -> Optional[int]:
+	"""Index of the paren closing the one at `start`."""
+	depth = 0
+	for index in range(start, len(items)):
+		item = items[index]
+		if isinstance(item, Paren) and item.ptype in "()":
+			depth += 1 if item.ptype == "(" else -1
+			if depth == 0:
+				return index
+	return None
+
+
+
+def remember(cache: utils.LRU[Hashable, Tuple[object, Optional[Exception]]], key: Hashable, compute: Callable[[], object]) -> object:
+	"""`compute()` cached by the key, the exception it raises is cached (and raised again) as well."""
+	outcome = cache.get(key)
+	if outcome is None:
+		try:
+			outcome = cache.put(key, (compute(), None))
+		except Exception as e:
+			outcome = cache.put(key, (None, e))
+	
+	value, error = outcome
+	if error is not None:
+		raise error
+	return value
+
+
+
+def group_value(items: List[Expression], unit: Unit) -> object:
+	"""Value of a parenthesized group, cached by its structure (groups are not nodes of the tree)."""
+	return remember(VALUES, intern(("group", *(x.structure() for x in items))), unit.evaluate)
+
+
+
+def split(items: List[Expression]) -> Unit:
+	"""Compile the items, the fractions and the parenthesized groups in them are substituted by names (see `utils`).
+	
+	Raises `SyntaxError` or `utils.Unsplittable` if the items can't be evaluated in parts, the fractions are not
+	compiled (see `Expression.check()`). The compiled code is cached by the code with the names.
+	"""
+	code: List[str] = []
+	values: Dict[str, Callable[[], object]] = {}
+	index = 0
+	while index < len(items):
+		item = items[index]
+		end = closing(items, index) if isinstance(item, Paren) and item.ptype == "(" and grouping(code) else None
+		if isinstance(item, Fraction):
+			name = f"_frac{len(values)}"
+			values[name] = item.evaluate
+			code.append(f"({name})")  # the same parentheses as `Fraction.__str__()`, `abs(...)` stays a call
+		elif end is not None and (group := split(items[index + 1:end])).code.strip():  # not an empty tuple
+			name = f"_group{len(values)}"
+			values[name] = functools.partial(group_value, items[index + 1:end], group)
+			code.append(f"({name})")
+			index = end
+		else:
+			code.append(str(item))
+		index += 1
+	
+	source = "".join(code)
+	compiled = remember(UNITS, (source, *values), lambda: utils.compile_unit(source, list(values)))
+	return Unit(source, compiled, values)
+
+
+
 class Expression:
+	cache: Optional[Tuple[object, Optional[Exception]]] = None  # (value, error), see `evaluate()`
+	compiled: Optional[Tuple[object, Optional[Unit], Optional[Exception]]] = None  # (signature, unit, error), see `Row.unit()`
+	checked = False  # see `check()`
+	key: Optional[int] = None  # see `structure()`
+	rendered: Optional[RenderOutput] = None  # see `layout()`
+	frames: Optional[Dict[int, Frame]] = None  # terminal width -> frame, see `layout()`
+	breaker: Optional[wrap.LineBreaker] = None  # see `Row.wrap()`
+	
+	
 	def children(self) -> List[Expression]:
 		raise NotImplementedError
 	
@@ -247,64 +489,136 @@ class Expression:
 		raise NotImplementedError
 	
 	
-	@profile
-	def display(self, colormap: bool = True, code: bool = True, dump: bool = True) -> None:  # todo: curses
-		"""Render the expression onto the screen"""
-		r = self.render()
+	def layout(self, width: int) -> Frame:
+		"""The rendered expression cropped to the terminal width.
+		
+		The render is cached until the next keystroke and the frames are cached per width, so resizing the terminal
+		only crops (or wraps, see `wrap()`) the existing render, or reuses the frame if the terminal had the same width.
+		"""
+		if self.rendered is None or self.frames is None:
+			self.rendered = self.render()
+			self.frames = {}
+		
+		if width not in self.frames:
+			self.frames[width] = compose(self.wrap(width), width)
+		return self.frames[width]
+	
+	
+	def wrap(self, width: int) -> RenderOutput:
+		"""The render (see `layout()`) broken into lines fitting into the width."""
+		assert self.rendered is not None
+		return self.rendered
+	
+	
+	@profiled
+	def display(self, result: Optional[str] = None, budget: float = FRAME_BUDGET, extra: int = 0) -> int:  # todo: curses
+		"""Render the expression onto the screen, return the number of panels that were left out
 		
-		if not r.cursor:
-			raise ValueError("cursor is missing")
+		The equation is drawn first. The panels below it are computed only while the frame fits into `budget` seconds
+		(plus `extra` more of them), the rest is drawn as a placeholder, see `PANELS`. The `Panel.idle` ones are computed
+		only as the `extra` ones. The cached panels are always drawn. `result` overrides the output of `run()` in the eval
+		panel.
+		"""
+		start = time.perf_counter()
+		frame = self.layout(shutil.get_terminal_size().columns)
 		
-		if VIRTUAL_CURSOR:
-			# add a single-space border to the right edge
-			for index in range(len(r.lines)):
-				r.lines[index] += " "
-				r.colors[index].append(ansi.reset)
+		# clear, home, equation
+		print("\033[2J\033[H" + "\n".join(frame.lines), end="\n", flush=True)
 		
 		output = []
-		for row, (line, color) in enumerate(zip(r.lines, r.colors)):
-			assert len(line) == len(color)
-			colored_line = []
+		missing = 0
+		for panel in PANELS:
+			if not panel.enabled:
+				continue
 			
-			for col, (ch, pixel) in enumerate(zip(line, color)):
-				if VIRTUAL_CURSOR and row == r.cursor.row and col == r.cursor.col:
-					pixel = f"{pixel}{ansi.inv}"
-				
-				colored_line.append(f"{pixel}{ch}{ansi.reset}")
+			key = panel.key(self, frame, result)
+			lines = panel.cached(key)
+			if lines is None and not panel.idle and time.perf_counter() - start < budget:
+				lines = panel.update(key, self, frame, result)
+			elif lines is None and extra > 0:
+				extra -= 1
+				lines = panel.update(key, self, frame, result)
 			
-			output.append("".join(colored_line))
-		
-		if colormap:
-			output.append("")
-			for row in r.colors:
-				line = []
-				for color in row:
-					line.append(f"{color or ansi.reset}▒{ansi.reset}")
-				output.append("".join(line))
-		
-		if code:
-			eval_result = utils.run(str(self))
-			output.append("")
-			output.append(f"{ansi.blue('code:')} {self}")
-			output.append("")
-			output.append(f"{ansi.blue('eval:')} {eval_result}")
-		
-		if dump:
-			output.append(f"{ansi.blue('repr:')} {repr(expression)}")
+			if lines is None:
+				missing += 1
+				lines = ["", ansi.faint(f"{panel.title} ...")]
+			output.extend(lines)
 		
 		output.append("")  # newline at the end of the output
 		
 		if not VIRTUAL_CURSOR:
-			output.append(cursor_string(r.cursor))
+			output.append(cursor_string(frame.cursor))
 		
-		# clear, home, content
-		print("\033[2J\033[H" + "\n".join(output), end="", flush=True)
+		print("\n".join(output), end="", flush=True)
+		return missing
 	
 	
 	def press_key(self, key: str, root: Row = None, rparent: Row = None, parent: Expression = None, skip_empty: bool = True) -> bool:
 		raise NotImplementedError
 	
 	
+	def insert(self, string: str, root: Row = None, rparent: Row = None, parent: Expression = None) -> bool:
+		"""Insert a whole string at the cursor (paste), the result is the same as typing it character by character."""
+		raise NotImplementedError
+	
+	
+	def latex(self) -> Iterator[str]:
+		"""LaTeX code of the expression, in chunks."""
+		raise NotImplementedError
+	
+	
+	def compute(self) -> object:
+		"""Evaluate the expression, assuming the children are already evaluated (or cached)."""
+		raise NotImplementedError
+	
+	
+	def evaluate(self) -> object:
+		"""Value of the expression, cached on the node until `invalidate()` is called."""
+		if self.cache is None:
+			try:
+				self.cache = (self.compute(), None)
+			except Exception as e:
+				self.cache = (None, e)
+		
+		value, error = self.cache
+		if error is not None:
+			raise error
+		return value
+	
+	
+	def check(self) -> None:
+		"""Compile the units of the subtree, raise `SyntaxError` or `utils.Unsplittable` (see `split()`).
+		
+		A subtree that passed is not checked again until it is invalidated, so only the edited path is.
+		"""
+		if not self.checked:
+			for child in self.children():
+				child.check()
+			self.checked = True
+	
+	
+	def invalidate(self) -> None:
+		self.cache = None
+		self.checked = False
+		self.key = None
+	
+	
+	def structure(self) -> int:
+		"""Id shared by all the structurally identical subtrees (the cursor is ignored).
+		
+		Rows and fractions remember it until they are invalidated, so only the edited path is hashed again.
+		"""
+		raise NotImplementedError
+	
+	
+	def path_to_cursor(self) -> List[Expression]:
+		"""The nodes from this one down to the text with the cursor (empty if the cursor is not in this subtree)."""
+		for child in self.children():
+			if path := child.path_to_cursor():
+				return [self, *path]
+		return []
+	
+	
 	def __str__(self) -> str:
 		raise NotImplementedError
 	
@@ -316,10 +630,20 @@ class Expression:
 
 class Text(Expression):
 	def __init__(self, text: str = "", cursor: Optional[ScreenOffset] = None):
-		self.text: str = text
+		self.buffer = gapbuffer.GapBuffer(text)  # edited at the cursor, see `press_key()`
 		self.cursor: Optional[ScreenOffset] = cursor
 	
 	
+	@property
+	def text(self) -> str:
+		return str(self.buffer)
+	
+	
+	@text.setter
+	def text(self, text: str) -> None:
+		self.buffer = gapbuffer.GapBuffer(text)
+	
+	
 	def children(self) -> List[Expression]:
 		return []
 	
@@ -342,7 +666,7 @@ class Text(Expression):
 	
 	def render(self, root: Row = None, rparent: Row = None, parent: Expression = None) -> RenderOutput:
 		assert isinstance(root, Row) and isinstance(rparent, Row)
-		return RenderOutput([self.text], [self.colorize(root, rparent, parent)], 0, len(self.text), self.cursor)
+		return RenderOutput([self.text], [self.colorize(root, rparent, parent)], 0, len(self.buffer), self.cursor)
 	
 	
 	def press_key(self, key: str, root: Row = None, rparent: Row = None, parent: Expression = None, skip_empty: bool = True) -> bool:
@@ -353,21 +677,18 @@ class Text(Expression):
 			return False  # we don't have the cursor, move on
 		
 		if key.isprintable():
-			before_cursor, after_cursor = self.text[:self.cursor.col], self.text[self.cursor.col:]
-			sequence = before_cursor + key
+			# only the end of the text before the cursor, the text is split only when a new node is inserted
+			sequence = self.buffer[max(0, self.cursor.col - 5):self.cursor.col] + key
 			
-			# todo: expanders (run always for all texts?)
+			# todo: expanders (run always for all texts?), names are expanded by TAB (see `complete`)
 			if sequence.endswith("\\frac"):
-				self.text = before_cursor[:-4] + after_cursor
+				self.buffer.delete(self.cursor.col - 4, self.cursor.col)
 				self.cursor = self.cursor.left(4)
 				root.press_key("/")
 			
-			elif sequence.endswith("sqrt("):
-				# todo
-				pass
-			
 			elif key == "/":  # todo: shift-/ to split?
-				eprint(ansi.yellow("INSERTING FRACTION"))
+				logger.debug("inserting fraction")
+				before_cursor, after_cursor = self.buffer[:self.cursor.col], self.buffer[self.cursor.col:]
 				if FRAC_INS_METHOD == "maple":
 					rparent.replace(self, row(fraction(text(before_cursor), text(cursor=ScreenOffset(0, 0))), text(after_cursor)))
 				elif FRAC_INS_METHOD == "split":
@@ -375,26 +696,28 @@ class Text(Expression):
 				elif FRAC_INS_METHOD == "empty":
 					rparent.replace(self, row(text(before_cursor), fraction(text(cursor=ScreenOffset(0, 0)), text()), text(after_cursor)))
 				else:
-					eprint(ansi.red("FRAC_INS_METHOD contains invalid value"))
+					logger.error("FRAC_INS_METHOD contains invalid value")
 					exit(1)
 			
 			elif key == "(":
-				eprint(ansi.yellow("INSERTING LPAREN"))
+				logger.debug("inserting lparen")
+				before_cursor, after_cursor = self.buffer[:self.cursor.col], self.buffer[self.cursor.col:]
 				rparent.replace(self, row(text(before_cursor), lparen(), text(after_cursor, cursor=ScreenOffset(0, 0))))
 			
 			elif key == ")":
-				eprint(ansi.yellow("INSERTING RPAREN"))
+				logger.debug("inserting rparen")
+				before_cursor, after_cursor = self.buffer[:self.cursor.col], self.buffer[self.cursor.col:]
 				rparent.replace(self, row(text(before_cursor), rparen(), text(after_cursor, cursor=ScreenOffset(0, 0))))
 			
 			else:
-				eprint(ansi.yellow(f"INSERTING TEXT: '{key}'"))
-				self.text: str = before_cursor + key + after_cursor
+				logger.debug("inserting text: '%s'", key)
+				self.buffer.insert(self.cursor.col, key)
 				self.cursor = self.cursor.right(1)
 		
 		if key == readchar.key.BACKSPACE:
 			if self.cursor.col > 0:  # there is at least one deletable char
-				eprint(ansi.yellow(f"REMOVE: '{self.text[self.cursor.col - 1]}'"))
-				self.text = self.text[:self.cursor.col - 1] + self.text[self.cursor.col:]
+				removed = self.buffer.delete(self.cursor.col - 1, self.cursor.col)
+				logger.debug("remove: '%s'", removed)
 				self.cursor = self.cursor.left(1)
 				assert self.cursor.col >= 0
 			
@@ -402,7 +725,7 @@ class Text(Expression):
 				# try to remove lparen or rparen
 				neighbor_left = rparent.neighbor_left(self)
 				if isinstance(neighbor_left, Paren):
-					eprint(ansi.yellow("REMOVING PAREN"))
+					logger.debug("removing paren")
 					rparent.delete(neighbor_left)
 					return True  # keystroke accepted
 				
@@ -416,13 +739,23 @@ class Text(Expression):
 				# try to remove fraction
 				if isinstance(parent, Fraction) and neighbor_left is None:
 					if rparent is parent.denominator:
-						eprint(ansi.yellow("REMOVING FRACTION"))
+						logger.debug("removing fraction")
 						frac_contents = parent.numerator.items + parent.denominator.items
 						root.parentof(parent).replace(parent, row(*frac_contents))
 					else:  # fraction will not get deleted if backspace was pressed inside the numerator
 						root.press_key(readchar.key.LEFT)
 					return True  # keystroke accepted
 		
+		if key == readchar.key.TAB:
+			prefix = complete.identifier(self.text, self.cursor.col)
+			candidates = completer.complete(prefix, 1)
+			if candidates:  # expand the identifier like \frac
+				logger.debug("completing: '%s'", candidates[0])
+				self.buffer.insert(self.cursor.col, candidates[0][len(prefix):])
+				self.cursor = self.cursor.right(len(candidates[0]) - len(prefix))
+				if candidates[0] in completer.functions:
+					root.press_key("(")
+		
 		if key == readchar.key.LEFT:
 			if self.cursor.col > 0:
 				self.cursor = self.cursor.left(1)
@@ -430,7 +763,7 @@ class Text(Expression):
 				root.press_key(readchar.key.UP, skip_empty=False)
 		
 		if key == readchar.key.RIGHT:
-			if self.cursor.col < len(self.text):  # + one space at the end
+			if self.cursor.col < len(self.buffer):  # + one space at the end
 				self.cursor = self.cursor.right(1)
 			else:
 				if SKIP_DENOMINATOR:  # maple, mathquill: RIGHT inside numerator causes the cursor to jump right after the fraction
@@ -447,29 +780,119 @@ class Text(Expression):
 			for expr in reversed(bfs_line[:obj_index(bfs_line, self)]):
 				if isinstance(expr, Text):  # where we can jump to
 					if skip_empty and not expr.text: continue
-					eprint("target:", expr.__class__.__name__, ansi.green(f"'{expr}'"))
+					logger.debug("target: %s '%s'", expr.__class__.__name__, expr)
 					self.cursor = None
 					# expr.cursor = ScreenOffset(0, 0)  # start of the text field
 					expr.cursor = ScreenOffset(0, len(expr.text))  # end of the text field
 					break
 			else:  # no break happened before
-				eprint(ansi.red("WARNING:"), "ran out of targets (DOWN)")
+				logger.warning("ran out of targets (UP)")
 		
 		if key == readchar.key.DOWN:
 			bfs_line = root.bfs_children()
 			for expr in bfs_line[obj_index(bfs_line, self) + 1:]:
 				if isinstance(expr, Text):  # where we can jump to
 					if skip_empty and not expr.text: continue
-					eprint("target:", expr.__class__.__name__, ansi.green(f"'{expr}'"))
+					logger.debug("target: %s '%s'", expr.__class__.__name__, expr)
 					self.cursor = None
 					expr.cursor = ScreenOffset(0, 0)  # start of the text field
 					break
 			else:  # no break happened before
-				eprint(ansi.red("WARNING:"), "ran out of targets (DOWN)")
+				logger.warning("ran out of targets (DOWN)")
 		
 		return True  # keystroke accepted
 	
 	
+	def insert(self, string: str, root: Row = None, rparent: Row = None, parent: Expression = None) -> bool:
+		assert isinstance(root, Row) and isinstance(rparent, Row)
+		
+		if not self.cursor:
+			return False  # we don't have the cursor, move on
+		
+		# Builds the same structure as `press_key()` would, but in a single pass. The row being built is suspended
+		# whenever a fraction is inserted, and finished once the cursor leaves it (at the end of the string).
+		current: Optional[Row] = None  # None is the top level, it replaces this text
+		items: List[Expression] = []
+		before: List[str] = [self.text[:self.cursor.col]]  # before the cursor
+		after = self.text[self.cursor.col:]  # after the cursor
+		rest: List[Expression] = []  # after the cursor text
+		suspended: List[Tuple[Optional[Row], List[Expression], str, List[Expression]]] = []
+		
+		for char in string.replace("\\frac", "/"):
+			if not char.isprintable():
+				continue
+			
+			if char in "()":
+				items.extend([Text("".join(before)), Paren(char)])
+				before = []
+			
+			elif char == "/":
+				if FRAC_INS_METHOD == "maple":
+					denominator = Row([])
+					items.extend([Text(), Fraction(row(Text("".join(before))), denominator), Text()])
+					suspended.append((current, items, after, rest))
+					current, items, before, after, rest = denominator, [], [], "", []
+				elif FRAC_INS_METHOD == "split":
+					denominator = Row([])
+					items.extend([Text(), Fraction(row(Text("".join(before))), denominator), Text()])
+					suspended.append((current, items, "", rest))
+					current, items, before, rest = denominator, [], [], []
+				elif FRAC_INS_METHOD == "empty":
+					numerator = Row([])
+					items.extend([Text("".join(before)), Text(), Fraction(numerator, text())])
+					suspended.append((current, items, after, rest))
+					current, items, before, after, rest = numerator, [], [], "", []
+				else:
+					logger.error("FRAC_INS_METHOD contains invalid value")
+					exit(1)
+			
+			else:
+				before.append(char)
+		
+		cursor_text = "".join(before)
+		items.append(Text(cursor_text + after, cursor=ScreenOffset(0, len(cursor_text))))
+		items.extend(rest)
+		
+		while suspended:
+			if current is not None:
+				current.items = items
+				current.sanitize()
+			current, items, after, rest = suspended.pop()
+			items.append(Text(after))
+			items.extend(rest)
+		
+		self.cursor = None
+		rparent.replace(self, Row(items))
+		return True
+	
+	
+	def latex(self) -> Iterator[str]:
+		# `**` is a superscript, `Row.latex()` adds the exponent if it's the next item (the text ends with `**`)
+		parts = self.text.split("**")
+		yield latex_escape(parts[0])
+		nested = 0  # `x**2**3` is `x^{2^{3}}`
+		for part in parts[1:]:
+			operand = EXPONENT.match(part)
+			if operand is None:
+				yield "}" * nested + ("^" + latex_escape(part) if part.strip() else "")
+				nested = 0
+				continue
+			
+			yield "^{" + latex_escape(operand.group(1))
+			nested += 1
+			if part[operand.end():]:
+				yield "}" * nested + latex_escape(part[operand.end():])
+				nested = 0
+		yield "}" * nested
+	
+	
+	def structure(self) -> int:
+		return intern(("text", self.text))
+	
+	
+	def path_to_cursor(self) -> List[Expression]:
+		return [self] if self.cursor else []
+	
 	
 	def __str__(self) -> str:
 		return self.text
@@ -480,13 +903,14 @@ class Text(Expression):
 		if self.cursor:
 			cur = (", " if self.text else "") + f"cursor=ScreenOffset({self.cursor.row}, {self.cursor.col})"
 		
-		return f'text("{self.text}"{cur})' if self.text else f"text({cur})"
+		return f'text({json.dumps(self.text, ensure_ascii=False)}{cur})' if self.text else f"text({cur})"
 
 
 
 class Row(Expression):
 	def __init__(self, items: List[Expression]):
 		self.items = items
+		self.cursor_path: Set[int] = set()  # ids of the nodes containing the cursor, set by the root while rendering
 		self.sanitize()
 	
 	
@@ -500,6 +924,7 @@ class Row(Expression):
 		assert sum(ch is old for ch in self.items) == 1
 		self.items[obj_index(self.items, old)] = new
 		self.sanitize()
+		self.invalidate()
 	
 	
 	def delete(self, old: Expression) -> None:
@@ -507,6 +932,7 @@ class Row(Expression):
 		assert sum(ch is old for ch in self.bfs_children()) == 1
 		self.items.pop(obj_index(self.items, old))
 		self.sanitize()
+		self.invalidate()
 	
 	
 	
@@ -534,7 +960,8 @@ class Row(Expression):
 		return self.items[index:]
 	
 	
-	def render(self, root: Row = None, rparent: Row = None, parent: Expression = None) -> RenderOutput:
+	def render_items(self, root: Row = None, parent: Expression = None) -> Tuple[List[RenderOutput], int]:
+		"""Render all the items and align their baselines, but don't join them into lines yet."""
 		root = root or self
 		
 		# reset all the parentheses
@@ -565,14 +992,31 @@ class Row(Expression):
 			if isinstance(par, Paren):
 				rr[index] = par.render(root=root, rparent=self, parent=parent)
 		
-		# ALIGN BASELINES
+		# ALIGN BASELINES (without modifying the outputs, they can be shared, see `RENDERS`)
 		baseline = max(r.baseline for r in rr)
-		for r in rr:
-			for _ in range(baseline - r.baseline):  # todo: extend
-				r.lines.insert(0, " " * r.width)  # baseline top padding
-				r.colors.insert(0, list_align([""], r.width))  # baseline top padding
+		for index, r in enumerate(rr):
+			if r.baseline < baseline:
+				padding = baseline - r.baseline  # baseline top padding
+				lines = [" " * r.width] * padding + r.lines
+				colors = [list_align([""], r.width) for _ in range(padding)] + r.colors
+				rr[index] = RenderOutput(lines, colors, r.baseline, r.width, r.cursor)
 		
-		###############################################################################################
+		return rr, baseline
+	
+	
+	def render(self, root: Row = None, rparent: Row = None, parent: Expression = None) -> RenderOutput:
+		if root is None:
+			self.cursor_path = {id(x) for x in self.path_to_cursor()}
+		
+		# identical subtrees without the cursor are rendered only once
+		if id(self) not in (root or self).cursor_path:
+			key = self.structure()
+			return RENDERS.get(key) or RENDERS.put(key, self.render_uncached(root, parent))
+		return self.render_uncached(root, parent)
+	
+	
+	def render_uncached(self, root: Row = None, parent: Expression = None) -> RenderOutput:
+		rr, baseline = self.render_items(root, parent)
 		
 		width_so_far = 0
 		for r in rr:
@@ -586,12 +1030,125 @@ class Row(Expression):
 		lines = []
 		colors = []
 		for line_index in range(max(len(r.lines) for r in rr)):
-			lines.append("".join(str_align(r.lines[line_index] if len(r.lines) > line_index else "", r.width) for r in rr))
-			colors.append(flatten(list_align(r.colors[line_index] if len(r.colors) > line_index else [""], r.width) for r in rr))
+			line, color = join_line(rr, line_index)
+			lines.append(line)
+			colors.append(color)
 		
 		return RenderOutput(lines, colors, baseline, sum(r.width for r in rr), cursor)
 	
 	
+	def pieces(self) -> List[List[RenderOutput]]:
+		"""The baseline aligned items, grouped into the pieces between the operators in the texts (see `wrap.candidates()`)."""
+		rr, _ = self.render_items()
+		output: List[List[RenderOutput]] = [[]]
+		for item, r in zip(self.items, rr):
+			if not isinstance(item, Text):
+				output[-1].append(r)
+				continue
+			
+			candidates = wrap.candidates(item.text)
+			bounds = [0, *(index for index in candidates if index < r.width), r.width]
+			for index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+				if index > 0:
+					output.append([])
+				output[-1].append(crop(r, start, end))
+			if r.width in candidates:  # breaks right after the text
+				output.append([])
+		
+		return [piece for piece in output if piece]
+	
+	
+	def wrap(self, width: int) -> RenderOutput:
+		"""Break the (top-level) row into lines fitting into the width, after the operators in the texts.
+		
+		The breaks are chosen by `wrap.LineBreaker`, which keeps the breaks before the edited piece from the last time.
+		Pieces wider than the terminal are left on their own lines (and scrolled horizontally, see `compose()`).
+		"""
+		assert self.rendered is not None
+		width = width - 1 if VIRTUAL_CURSOR else width  # the border, see `compose()`
+		if not LINE_BREAKING or self.rendered.width <= width:
+			return self.rendered
+		
+		pieces = self.pieces()
+		baseline = max(r.baseline for r in flatten(pieces))  # all the items are padded to it
+		self.breaker = self.breaker or wrap.LineBreaker()
+		breaks = self.breaker.breaks([sum(r.width for r in piece) for piece in pieces], width)
+		
+		lines: List[str] = []
+		colors: List[List[str]] = []
+		cursor = None
+		first_baseline = 0
+		for start, end in zip([0, *breaks], [*breaks, len(pieces)]):
+			part = flatten(pieces[start:end])
+			line_baseline = max(r.baseline for r in part)
+			top = baseline - line_baseline  # the rows above are padding in all of the pieces
+			if start == 0:
+				first_baseline = line_baseline
+			
+			width_so_far = 0
+			for r in part:
+				if r.cursor:
+					cursor = r.cursor.down(baseline - r.baseline - top + len(lines)).right(width_so_far)
+				width_so_far += r.width
+			
+			for line_index in range(top, max(len(r.lines) for r in part)):
+				line, color = join_line(part, line_index)
+				lines.append(line)
+				colors.append(color)
+		
+		total = max(len(line) for line in lines)
+		lines = [f"{line:<{total}}" for line in lines]
+		colors = [color + [""] * (total - len(color)) for color in colors]
+		return RenderOutput(lines, colors, first_baseline, total, cursor)
+	
+	
+	def stream(self, colored: bool = False) -> Iterator[str]:
+		"""The rendered lines one by one, without joining all of them in advance (see `export`).
+		
+		The renders of the items are still built in advance, only the joined lines are not kept.
+		"""
+		self.cursor_path = {id(x) for x in self.path_to_cursor()}
+		rr, _ = self.render_items()
+		for line_index in range(max(len(r.lines) for r in rr)):
+			line, color = join_line(rr, line_index)
+			yield color_line(line, color) if colored else line
+	
+	
+	def latex(self) -> Iterator[str]:
+		# only the paired parentheses can be \left( and \right)
+		stack: List[int] = []
+		pairs: Dict[int, int] = {}  # index of a left paren -> index of its right paren
+		for index, item in enumerate(self.items):
+			if isinstance(item, Paren):
+				if item.dir == Direction.LEFT:
+					stack.append(index)
+				elif stack:
+					pairs[stack.pop()] = index
+		
+		yield from self.latex_items(0, len(self.items), pairs)
+	
+	
+	def latex_items(self, start: int, end: int, pairs: Dict[int, int]) -> Iterator[str]:
+		paired = set(pairs) | set(pairs.values())
+		index = start
+		while index < end:
+			item = self.items[index]
+			yield from item.latex(index in paired) if isinstance(item, Paren) else item.latex()
+			index += 1
+			
+			# the exponent of a text ending with `**` is the next fraction or the next parenthesized group (without the
+			# parens, the braces group it)
+			if isinstance(item, Text) and item.text.rstrip().endswith("**"):
+				yield "^{"
+				if index < end and index in pairs:
+					yield from self.latex_items(index + 1, pairs[index], pairs)
+					index = pairs[index] + 1
+				elif index < end and isinstance(self.items[index], Fraction):
+					yield from self.items[index].latex()
+					index += 1
+				yield "}"
+	
+	
 	def sanitize(self) -> bool:
 		output = []
 		
@@ -602,34 +1159,115 @@ class Row(Expression):
 			else:
 				output.append(child)
 		
-		# join adjacent texts
-		while True:
-			for idx, (a, b) in enumerate(zip(output, output[1:])):
-				if isinstance(a, Text) and isinstance(b, Text):
-					if b.cursor:
-						a.cursor = ScreenOffset(0, len(a.text)).right(b.cursor.col)
-					a.text = f"{a.text}{b.text}"
-					output.pop(idx + 1)
-					break
+		# join adjacent texts (in a single pass, pasting can produce a lot of them)
+		joined: List[Expression] = []
+		for b in output:
+			a = joined[-1] if joined else None
+			if isinstance(a, Text) and isinstance(b, Text):
+				if b.cursor:
+					a.cursor = ScreenOffset(0, len(a.buffer)).right(b.cursor.col)
+				a.buffer.insert(len(a.buffer), b.text)
 			else:
-				break
+				joined.append(b)
+		output = joined
 		
 		something_happened = self.items != output
 		self.items = output
+		if something_happened:
+			self.invalidate()
 		return something_happened
 	
 	
 	def press_key(self, key: str, root: Row = None, rparent: Row = None, parent: Expression = None, skip_empty: bool = True) -> bool:
+		if root is None:
+			self.rendered = None  # the cursor and/or the contents are about to change, see `layout()`
+		
+		if key.startswith(PASTE_START) and key.endswith(PASTE_END):
+			return self.insert(key[len(PASTE_START):-len(PASTE_END)], root, rparent, parent)
+		
 		root = root or self
 		for child in self.children():
 			if child.press_key(key, root=root, rparent=self, parent=parent, skip_empty=skip_empty):
+				if is_edit(key):
+					self.invalidate()  # the key went through this row, so the edited node is somewhere below
 				return True  # cursor could be moved multiple times if we wouldn't stop right there
 		return False  # not accepted yet... (dead end)
 	
 	
+	def insert(self, string: str, root: Row = None, rparent: Row = None, parent: Expression = None) -> bool:
+		if root is None:
+			self.rendered = None  # see `layout()`
+		
+		root = root or self
+		for child in self.children():
+			if child.insert(string, root=root, rparent=self, parent=parent):
+				self.invalidate()
+				return True
+		return False
+	
+	
+	def unit(self) -> Unit:
+		"""The row compiled by `split()`, compiled again only once the code of the row itself changes.
+		
+		An edit below a fraction changes only its value, which is looked up once the code gets to it. The row is compared
+		only if it was invalidated since (see `check()`).
+		"""
+		signature = tuple(x if isinstance(x, Fraction) else str(x) for x in self.items) if not self.checked else None
+		if self.compiled is None or (signature is not None and self.compiled[0] != signature):
+			try:
+				self.compiled = (signature, split(self.items), None)
+			except (SyntaxError, utils.Unsplittable) as e:
+				self.compiled = (signature, None, e)
+		
+		_, unit, error = self.compiled
+		if error is not None:
+			raise error
+		return unit
+	
+	
+	def check(self) -> None:
+		if not self.checked:
+			self.unit()
+			super().check()
+	
+	
+	def compute(self) -> object:
+		# the fractions and the groups are evaluated on their own (and cached) once the code gets to them
+		return self.unit().evaluate()
+	
+	
+	def run(self) -> str:
+		"""The same output as `utils.run(str(self))`, but evaluated in parts if `INCREMENTAL_EVAL` is enabled.
+		
+		The code that can't be split (statements, calls of anything but `utils.PURE`, syntax errors) is run as a whole.
+		"""
+		splittable = INCREMENTAL_EVAL
+		if splittable:
+			try:
+				self.check()
+				splittable = bool(self.unit().code[:1].strip())  # empty or indented code is a syntax error
+			except (SyntaxError, utils.Unsplittable):
+				splittable = False
+		
+		if not splittable:
+			return utils.run(str(self))  # captures what the code prints, reports the first syntax error
+		
+		try:
+			value = self.evaluate()
+		except Exception as e:
+			return f"{e}\n"
+		return "" if value is None else f"{value!r}\n"
+	
+	
+	def structure(self) -> int:
+		if self.key is None:
+			self.key = intern(("row", *(x.structure() for x in self.items)))
+		return self.key
+	
 	
 	def __str__(self) -> str:
-		return "".join(str(x) for x in self.items)
+		key = self.structure()
+		return CODES.get(key) or CODES.put(key, "".join(str(x) for x in self.items))
 	
 	
 	def __repr__(self) -> str:
@@ -656,6 +1294,14 @@ class Fraction(Expression):
 	def render(self, root: Row = None, rparent: Row = None, parent: Expression = None) -> RenderOutput:
 		assert isinstance(root, Row) and isinstance(rparent, Row)
 		
+		# identical subtrees without the cursor are rendered only once
+		if id(self) not in root.cursor_path:
+			key = self.structure()
+			return RENDERS.get(key) or RENDERS.put(key, self.render_uncached(root, rparent))
+		return self.render_uncached(root, rparent)
+	
+	
+	def render_uncached(self, root: Row, rparent: Row) -> RenderOutput:
 		n = self.numerator.render(root=root, rparent=rparent, parent=self)
 		d = self.denominator.render(root=root, rparent=rparent, parent=self)
 		w = 2 * FRAC_PADDING + max(n.width, d.width)
@@ -676,22 +1322,53 @@ class Fraction(Expression):
 		output.extend(str_align(l, w) for l in d.lines)
 		
 		colors: List[List[str]] = []
-		colors.extend(list_align(c, w) for c in n.colors)
+		colors.extend(list_align(list(c), w) for c in n.colors)
 		colors.append([FRAC_COLOR] * w)
-		colors.extend(list_align(c, w) for c in d.colors)
+		colors.extend(list_align(list(c), w) for c in d.colors)
 		
 		return RenderOutput(output, colors, baseline, w, cursor)
 	
 	
 	def press_key(self, key: str, root: Row = None, rparent: Row = None, parent: Expression = None, skip_empty: bool = True) -> bool:
 		assert isinstance(root, Row) and isinstance(rparent, Row)
-		if self.numerator.press_key(key, root, rparent, self, skip_empty): return True  # keystroke accepted
-		if self.denominator.press_key(key, root, rparent, self, skip_empty): return True  # keystroke accepted
+		for child in self.children():
+			if child.press_key(key, root, rparent, self, skip_empty):
+				if is_edit(key):
+					self.invalidate()
+				return True  # keystroke accepted
 		return False  # not accepted yet... (dead end)
 	
 	
+	def insert(self, string: str, root: Row = None, rparent: Row = None, parent: Expression = None) -> bool:
+		assert isinstance(root, Row) and isinstance(rparent, Row)
+		for child in self.children():
+			if child.insert(string, root, rparent, self):
+				self.invalidate()
+				return True
+		return False
+	
+	
+	def compute(self) -> object:
+		return self.numerator.evaluate() / self.denominator.evaluate()
+	
+	
+	def latex(self) -> Iterator[str]:
+		yield r"\frac{"
+		yield from self.numerator.latex()
+		yield "}{"
+		yield from self.denominator.latex()
+		yield "}"
+	
+	
+	def structure(self) -> int:
+		if self.key is None:
+			self.key = intern(("fraction", self.numerator.structure(), self.denominator.structure()))
+		return self.key
+	
+	
 	def __str__(self) -> str:
-		return f"(({str(self.numerator) or 'None'}) / ({str(self.denominator) or 'None'}))"
+		key = self.structure()
+		return CODES.get(key) or CODES.put(key, f"(({str(self.numerator) or 'None'}) / ({str(self.denominator) or 'None'}))")
 	
 	
 	def __repr__(self) -> str:
@@ -761,6 +1438,19 @@ class Paren(Expression):
 		return False
 	
 	
+	def insert(self, string: str, root: Row = None, rparent: Row = None, parent: Expression = None) -> bool:
+		return False
+	
+	
+	def latex(self, paired: bool = False) -> Iterator[str]:
+		if not paired:
+			yield self.ptype
+		elif self.dir == Direction.LEFT:
+			yield rf"\left{self.ptype}"
+		else:
+			yield rf"\right{self.ptype}"
+	
+	
 	def find_pair(self, rr_unaligned: List[RenderOutput], rparent: Row) -> None:
 		if self.dir == Direction.LEFT:
 			neighbors_expr = rparent.all_neighbors_right(self)
@@ -782,6 +1472,10 @@ class Paren(Expression):
 		self.height = max([1] + [(self.baseline - r.baseline) + len(r.lines) for r in neighbors_rr[:index]])
 	
 	
+	def structure(self) -> int:
+		return intern(("paren", self.ptype))
+	
+	
 	def __str__(self) -> str:
 		return self.ptype
 	
@@ -792,7 +1486,7 @@ class Paren(Expression):
 
 
 def row(*items: Expression) -> Row:
-	return Row(list(items))
+	return Row(list(items) or [Text()])  # `repr()` leaves out the empty texts, the empty rows still need one
 
 
 
@@ -839,6 +1533,205 @@ def parenthesis(expr: Row) -> Row:
 
 
 
+@dataclass(eq=False)
+class Panel:
+	"""Secondary output below the equation, computed again only when its key changes (see `Expression.display()`)."""
+	title: str
+	toggle: str  # key switching the panel on and off
+	key: Callable[[Row, Frame, Optional[str]], Hashable]
+	compute: Callable[[Row, Frame, Optional[str]], List[str]]
+	idle: bool = False  # too slow for any frame budget, computed only while idle (no key is waiting)
+	enabled: bool = True
+	cache: Optional[Tuple[Hashable, List[str]]] = None
+	
+	
+	def cached(self, key: Hashable) -> Optional[List[str]]:
+		return self.cache[1] if self.cache is not None and self.cache[0] == key else None
+	
+	
+	def update(self, key: Hashable, expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+		lines = self.compute(expr, frame, result)
+		self.cache = (key, lines)
+		return lines
+
+
+
+def plot_panel(expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+	lines = plot.render(str(expr), PLOT_RANGE, PLOT_SAMPLES, min(PLOT_WIDTH, frame.width - 16), PLOT_HEIGHT)
+	return ["", *lines] if lines else []
+
+
+
+def colormap_panel(expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+	return ["", *("".join(f"{color or ansi.reset}▒{ansi.reset}" for color in row) for row in frame.colors)]
+
+
+
+def completion_prefix(expr: Row) -> str:
+	path = expr.path_to_cursor()
+	cursor_text = path[-1] if path else None
+	return complete.identifier(cursor_text.text, cursor_text.cursor.col) if isinstance(cursor_text, Text) else ""
+
+
+
+def completion_panel(expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+	candidates = completer.complete(completion_prefix(expr), COMPLETIONS)
+	return ["", f"{ansi.blue('complete:')} {'  '.join(candidates)}"] if candidates else []
+
+
+
+def cursor_key(expr: Row) -> Tuple[object, ...]:
+	path = expr.path_to_cursor()
+	return (expr.structure(), path[-1], path[-1].cursor) if path else (expr.structure(),)
+
+
+
+def code_panel(expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+	return ["", f"{ansi.blue('code:')} {expr}"]
+
+
+
+def eval_panel(expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+	return ["", f"{ansi.blue('eval:')} {expr.run() if result is None else result}"]
+
+
+
+def repr_panel(expr: Row, frame: Frame, result: Optional[str]) -> List[str]:
+	return [f"{ansi.blue('repr:')} {expr!r}"]
+
+
+
+# in the order of drawing, the keys must change whenever the output would
+PANELS = [
+	Panel("plot", readchar.key.F2, lambda expr, frame, result: (expr.structure(), frame.width), plot_panel, idle=True),
+	Panel("colormap", readchar.key.F3, lambda expr, frame, result: frame, colormap_panel),
+	Panel("code", readchar.key.F4, lambda expr, frame, result: expr.structure(), code_panel),
+	Panel("eval", readchar.key.F5, lambda expr, frame, result: (expr.structure(), result), eval_panel),
+	Panel("repr", readchar.key.F6, lambda expr, frame, result: cursor_key(expr), repr_panel),
+	Panel("complete", readchar.key.F7, lambda expr, frame, result: (completion_prefix(expr), completer.version), completion_panel),
+]
+
+
+
+def from_repr(source: str) -> Row:
+	"""Build the expression from its `repr`, only the constructor calls and string and integer literals are allowed.
+	
+	Nothing is evaluated, the syntax tree is walked instead (the source can come from a client of the server).
+	"""
+	constructors = {f.__name__: f for f in [row, text, paren, lparen, rparen, fraction, parenthesis, ScreenOffset]}
+	literals = {"text", "paren", "ScreenOffset"}  # the constructors taking literals, the others take expressions
+	
+	def build(node: ast.expr, literal: bool) -> object:
+		if literal and isinstance(node, ast.Constant) and type(node.value) in (str, int):
+			return node.value
+		if not literal and isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in constructors:
+			name = node.func.id
+			if any(keyword.arg != "cursor" or name != "text" for keyword in node.keywords):
+				raise ValueError(f"unexpected keyword argument of {name}()")
+			args = [build(arg, name in literals) for arg in node.args]
+			kwargs = {keyword.arg: build(keyword.value, False) for keyword in node.keywords}
+			if not all(isinstance(x, Expression) for x in args if not isinstance(x, (str, int))):
+				raise ValueError(f"invalid arguments of {name}()")
+			if not all(isinstance(x, ScreenOffset) for x in kwargs.values()):
+				raise ValueError(f"invalid cursor of {name}()")
+			try:
+				return constructors[name](*args, **kwargs)
+			except (AssertionError, TypeError) as e:
+				raise ValueError(f"invalid arguments of {name}(): {e}") from None
+		raise ValueError(f"unexpected {ast.unparse(node)}")
+	
+	try:
+		expr = build(ast.parse(source.strip(), mode="eval").body, False)
+	except SyntaxError as e:
+		raise ValueError(f"invalid syntax: {e}") from None
+	if not isinstance(expr, Row):
+		raise ValueError("not an expression")
+	return expr
+
+
+
+def with_cursor(expr: Row) -> Row:
+	"""Put the cursor at the beginning of the first text, unless the expression already has one."""
+	texts = [x for x in expr.bfs_children() if isinstance(x, Text)]
+	if texts and not any(x.cursor for x in texts):
+		texts[0].cursor = ScreenOffset(0, 0)
+	return expr
+
+
+
+def from_infix(code: str) -> Row:
+	"""Build the expression from the code, the divisions become fractions of their operands (the precedence is kept).
+	
+	Code that doesn't parse (is incomplete) is typed instead, key by key (see `Expression.insert()`).
+	"""
+	def plain(code: str) -> Row:
+		chars = "".join(char for char in code if char.isprintable())
+		return row(*(paren(x) if x in "()" else text(x) for x in re.split(r"([()])", chars) if x))
+	
+	def build(code: str) -> Row:
+		try:
+			tree = ast.parse(code)
+		except SyntaxError:
+			return plain(code)
+		
+		lines = code.splitlines(keepends=True)
+		starts = list(itertools.accumulate((len(line) for line in lines), initial=0))
+		
+		def offset(lineno: int, col: int) -> int:  # `col` counts the utf8 bytes
+			return starts[lineno - 1] + len(lines[lineno - 1].encode("utf8")[:col].decode("utf8"))
+		
+		def segment(node: ast.AST) -> Tuple[int, int]:
+			return offset(node.lineno, node.col_offset), offset(node.end_lineno, node.end_col_offset)
+		
+		def divisions(node: ast.AST) -> Iterator[ast.BinOp]:  # the outermost ones
+			if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+				yield node
+			else:
+				for child in ast.iter_child_nodes(node):
+					yield from divisions(child)
+		
+		items: List[Expression] = []
+		position = 0
+		for node in sorted(divisions(tree), key=segment):
+			start, end = segment(node)
+			items.append(plain(code[position:start]))
+			# the parens grouping the operands are left out (the fraction bar groups them)
+			items.append(fraction(build(code[slice(*segment(node.left))]), build(code[slice(*segment(node.right))])))
+			position = end
+		items.append(plain(code[position:]))
+		return row(*items)
+	
+	try:
+		ast.parse(code)
+	except SyntaxError:
+		expr = text(cursor=ScreenOffset(0, 0))
+		expr.insert(code)
+		return expr
+	return with_cursor(build(code))
+
+
+
+def serve_request(request: Dict[str, str]) -> Dict[str, object]:
+	"""Render and evaluate an expression given as `repr` or as infix code, see `server`."""
+	try:
+		expr = from_repr(request["repr"]) if "repr" in request else from_infix(request["infix"])
+		r = expr.render()
+		eval_result = expr.run()
+	except Exception as e:
+		return {"error": f"{e.__class__.__name__}: {e}"}
+	
+	return {
+		"lines": r.lines,
+		"colors": [[str(color) for color in line] for line in r.colors],
+		"baseline": r.baseline,
+		"width": r.width,
+		"code": str(expr),
+		"eval": eval_result,
+		"repr": repr(expr),
+	}
+
+
+
 expression = row(
 	parenthesis(
 		fraction(
@@ -892,14 +1785,115 @@ expression = row(
 
 # expression = text(cursor=ScreenOffset(0, 0))
 
+parser = argparse.ArgumentParser(prog="equed", description="WYSIWYG math editor for terminal")
+parser.add_argument("--record", metavar="FILE", help="record the keystrokes of this session into FILE")
+parser.add_argument("--replay", metavar="FILE", help="replay a recorded session without the UI, report keystroke latencies")
+parser.add_argument("--realtime", action="store_true", help="replay at the original pace instead of as fast as possible")
+parser.add_argument("--serve", metavar="ADDRESS", help="render/eval server on a unix socket path or on host:port")
+parser.add_argument("--workers", type=int, help="number of --serve worker processes (default: number of CPUs)")
+parser.add_argument("--export", choices=export.FORMATS, help="write the expression to stdout in the given format and exit")
+parser.add_argument("--store", metavar="FILE", help="archive of expressions (created if missing), see `store`")
+parser.add_argument("--id", type=int, help="expression in the --store to open, a new one is appended on exit if omitted")
+parser.add_argument("--sheet", action="store_true", help="share variables between the expressions in the --store, like a spreadsheet")
+parser.add_argument("--log-level", default=logging.getLevelName(LOG_LEVEL), choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="debug tracing on stderr")
+args = parser.parse_args()
+log.setup(logger, logging.getLevelName(args.log_level), background=not args.serve)  # the --serve workers are forked
+
+archive = store.Store(args.store) if args.store else None
+if archive is not None and args.id is not None:
+	expression = with_cursor(from_repr(archive[args.id]))
+
+if args.replay:
+	initial_repr, keys = session.load(args.replay)
+	expression = from_repr(initial_repr)
+	latencies = session.replay(expression, keys, realtime=args.realtime)
+	print(session.report(latencies))
+	print(f"{ansi.blue('repr:')} {repr(expression)}")
+	exit(0)
+
+if args.export:
+	if archive is not None and args.id is None:  # the whole archive, loading one expression at a time
+		export.export((from_repr(source) for source in archive), sys.stdout, args.export)
+	else:
+		export.export([expression], sys.stdout, args.export)
+	exit(0)
+
+if args.serve:
+	try:
+		server.serve(args.serve, serve_request, args.workers)
+	except ValueError as e:
+		parser.error(str(e))
+	exit(0)
+
+recorder = session.Recorder(args.record, repr(expression)) if args.record else None
+if recorder:
+	atexit.register(recorder.close)
+
+sheet = dependencies.Sheet() if archive is not None and args.sheet else None
+if sheet:
+	sheet_id = len(archive) if args.id is None else args.id  # the edited expression
+	sheet.update({id: str(from_repr(source)) for id, source in enumerate(archive) if id != sheet_id})
+	for id, code in sheet.code.items():
+		completer.update(id, code)
+
+
+
+def redraw(budget: float = FRAME_BUDGET, extra: int = 0) -> int:
+	completer.update(sheet_id if sheet else 0, str(expression))  # only when the code changed
+	if sheet:
+		sheet.set(sheet_id, str(expression))  # re-evaluates only the expressions depending on this one
+		return expression.display(sheet.results[sheet_id], budget, extra)
+	else:
+		return expression.display(budget=budget, extra=extra)
+
+
+
+toggles = {panel.toggle: panel for panel in PANELS}
+
+
+
+print("\033[?2004h", end="", flush=True)  # enable bracketed paste
+atexit.register(print, "\033[?2004l", end="", flush=True)
+
+keyboard = terminal.Keyboard(sys.stdin.fileno(), (PASTE_START, PASTE_END))
+keyboard.setup()
+atexit.register(keyboard.restore)
+
+# redraw right away on resize, but from the main loop (the handler could interrupt `press_key()` half way)
+resized, resize = os.pipe()
+os.set_blocking(resize, False)
+signal.set_wakeup_fd(resize)  # the handler itself does nothing, the signal number is written into the pipe
+signal.signal(signal.SIGWINCH, lambda signum, frame: None)
+
 while True:
-	expression.display()
+	missing = redraw()
+	# idle, fill in the left out panels one by one
+	while missing and not keyboard.pending and not select.select([keyboard.fd, resized], [], [], 0)[0]:
+		missing = redraw(budget=0, extra=1)
+	
+	if not keyboard.pending and resized in select.select([keyboard.fd, resized], [], [])[0]:
+		os.read(resized, 4096)
+		continue
 	
-	key = readchar.readkey()
-	aaaaaaa = key.replace('\x1b', '^')
-	eprint(f"\nkey pressed: {ansi.yellow(aaaaaaa)} {ansi.blue}0x{key.encode('utf8').hex()}{ansi.reset} ({list(readchar.key.__dict__.keys())[list(readchar.key.__dict__.values()).index(key)] if key in readchar.key.__dict__.values() else key})")
+	key = keyboard.readkey()  # the whole pasted text is a single key
+	if logger.isEnabledFor(logging.DEBUG):
+		logger.debug("key pressed: %s 0x%s (%s)", key.replace("\x1b", "^"), key.encode("utf8").hex(), KEY_NAMES.get(key, key))
 	
 	if key == readchar.key.CTRL_C:
 		break
 	
+	if key in toggles:
+		toggles[key].enabled = not toggles[key].enabled
+		continue
+	
+	if recorder:
+		recorder.record(key)
+	
 	expression.press_key(key)
+
+if archive is not None:
+	if args.id is None:
+		archive.append(repr(expression))
+	else:
+		archive[args.id] = repr(expression)
+	archive.close()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import builtins
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+from visual import dependencies
+
+MODULES = [builtins, math]  # the names always offered, functions are completed with an opening paren
+
+
+
+def identifier(text: str, end: int) -> str:
+	"""The identifier (or its beginning) right before `end`, empty if there is none (or it's an attribute)."""
+	start = end
+	while start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+		start -= 1
+	while start < end and text[start].isdigit():  # identifiers can't start with a digit
+		start += 1
+	
+	if start > 0 and text[start - 1] == ".":
+		return ""
+	return text[start:end]
+
+
+
+class Trie:
+	"""Prefix tree of names, a name added multiple times has to be removed as many times."""
+	
+	def __init__(self) -> None:
+		self.children: Dict[str, Trie] = {}
+		self.count = 0  # how many times the name ending here was added
+	
+	
+	def add(self, name: str) -> None:
+		node = self
+		for char in name:
+			node = node.children.setdefault(char, Trie())
+		node.count += 1
+	
+	
+	def remove(self, name: str) -> None:
+		path: List[Tuple[Trie, str]] = []
+		node = self
+		for char in name:
+			if char not in node.children:
+				return
+			path.append((node, char))
+			node = node.children[char]
+		
+		node.count = max(0, node.count - 1)
+		for parent, char in reversed(path):  # prune the branches without any names
+			child = parent.children[char]
+			if child.count or child.children:
+				break
+			del parent.children[char]
+	
+	
+	def find(self, prefix: str) -> Optional[Trie]:
+		node: Optional[Trie] = self
+		for char in prefix:
+			node = node.children.get(char)
+			if node is None:
+				break
+		return node
+	
+	
+	def complete(self, prefix: str, limit: int) -> List[str]:
+		"""At most `limit` names starting with the prefix, the shorter ones first, then alphabetically."""
+		start = self.find(prefix)
+		output: List[str] = []
+		level = [(prefix, start)] if start else []
+		while level and len(output) < limit:  # breadth first, stops at the depth where enough names were found
+			output.extend(name for name, node in level if node.count)
+			level = [(name + char, node.children[char]) for name, node in level for char in sorted(node.children)]
+		return output[:limit]
+
+
+
+class Completer:
+	"""Names to complete, the builtins, `math` and the names defined by the expressions (kept up to date by `update()`)."""
+	
+	def __init__(self) -> None:
+		self.trie = Trie()
+		self.functions: Set[str] = set()
+		for module in MODULES:
+			for name in dir(module):
+				if not name.startswith("_"):
+					self.trie.add(name)
+					if callable(getattr(module, name)):
+						self.functions.add(name)
+		
+		self.code: Dict[int, str] = {}
+		self.defined: Dict[int, Set[str]] = {}  # expression id -> names it defines
+		self.version = 0  # changes whenever the names do
+	
+	
+	def update(self, id: int, code: str) -> None:
+		"""Change the code of the expression, only the difference of the names it defines goes through the trie."""
+		if self.code.get(id) == code:
+			return
+		
+		self.code[id] = code
+		old = self.defined.get(id, set())
+		new, _ = dependencies.names(code)
+		for name in new - old:
+			self.trie.add(name)
+		for name in old - new:
+			self.trie.remove(name)
+		
+		self.defined[id] = new
+		if new != old:
+			self.version += 1
+	
+	
+	def complete(self, prefix: str, limit: int) -> List[str]:
+		return self.trie.complete(prefix, limit) if prefix else []
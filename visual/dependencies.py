@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import ast
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, List, Set, Tuple
+
+from visual import utils
+
+
+
+def names(code: str) -> Tuple[Set[str], Set[str]]:
+	"""Names defined (assigned to) and names referenced by the code."""
+	try:
+		tree = ast.parse(code)
+	except SyntaxError:
+		return set(), set()
+	
+	defined, referenced = set(), set()
+	for node in ast.walk(tree):
+		if isinstance(node, ast.Name):
+			(defined if isinstance(node.ctx, ast.Store) else referenced).add(node.id)
+	
+	return defined, referenced - defined
+
+
+
+class Sheet:
+	"""Equations sharing their variables, re-evaluated like a spreadsheet.
+	
+	Changing an equation re-evaluates only the equations that (transitively) depend on the names it defines (or used
+	to define), in topological order. Every equation is evaluated only with the values of the names it references.
+	"""
+	
+	def __init__(self) -> None:
+		self.code: Dict[int, str] = {}
+		self.defines: Dict[int, Set[str]] = {}
+		self.uses: Dict[int, Set[str]] = {}
+		self.definers: DefaultDict[str, Set[int]] = defaultdict(set)  # name -> equations defining it
+		self.users: DefaultDict[str, Set[int]] = defaultdict(set)  # name -> equations referencing it
+		self.values: Dict[int, Dict[str, object]] = {}  # values of the names defined by each equation
+		self.results: Dict[int, str] = {}  # output of each equation, the same as `utils.run()`
+	
+	
+	def set(self, id: int, code: str) -> List[int]:
+		return self.update({id: code})
+	
+	
+	def update(self, changes: Dict[int, str]) -> List[int]:
+		"""Change the code of the equations, returns all the re-evaluated equations in the order of evaluation."""
+		dirty: Set[int] = set()
+		for id, code in changes.items():
+			if self.code.get(id) == code:
+				continue
+			
+			old = self.defines.get(id, set())
+			self.unlink(id)
+			self.code[id] = code
+			self.defines[id], self.uses[id] = names(code)
+			for name in self.defines[id]:
+				self.definers[name].add(id)
+			for name in self.uses[id]:
+				self.users[name].add(id)
+			
+			dirty.add(id)
+			for name in old:  # the users of a name that is no longer defined here have to notice as well
+				dirty |= self.users[name]
+		
+		order = self.toposort(self.dependents(dirty))
+		for id in order:
+			self.evaluate(id)
+		return order
+	
+	
+	def remove(self, id: int) -> List[int]:
+		dirty = set()
+		for name in self.defines.get(id, set()):
+			dirty |= self.users[name]
+		self.unlink(id)
+		for mapping in (self.code, self.defines, self.uses, self.values, self.results):
+			mapping.pop(id, None)
+		
+		order = self.toposort(self.dependents(dirty - {id}))
+		for other in order:
+			self.evaluate(other)
+		return order
+	
+	
+	def unlink(self, id: int) -> None:
+		for name in self.defines.get(id, set()):
+			self.definers[name].discard(id)
+		for name in self.uses.get(id, set()):
+			self.users[name].discard(id)
+	
+	
+	def predecessors(self, id: int) -> Set[int]:
+		return {definer for name in self.uses[id] for definer in self.definers[name]} - {id}
+	
+	
+	def dependents(self, ids: Iterable[int]) -> Set[int]:
+		"""The equations and everything that transitively depends on them."""
+		found = set(ids)
+		stack = list(found)
+		while stack:
+			for name in self.defines[stack.pop()]:
+				for user in self.users[name] - found:
+					found.add(user)
+					stack.append(user)
+		return found
+	
+	
+	def toposort(self, ids: Set[int]) -> List[int]:
+		"""Kahn's algorithm on the affected equations only, equations in a cycle are reported and left out."""
+		incoming = {id: len(self.predecessors(id) & ids) for id in ids}
+		ready = sorted((id for id, count in incoming.items() if count == 0), reverse=True)
+		order = []
+		while ready:
+			id = ready.pop()
+			order.append(id)
+			for user in {user for name in self.defines[id] for user in self.users[name] & ids} - {id}:
+				incoming[user] -= 1
+				if incoming[user] == 0:
+					ready.append(user)
+		
+		for id in ids - set(order):
+			self.values[id] = {}
+			self.results[id] = "circular reference\n"
+		return order
+	
+	
+	def evaluate(self, id: int) -> None:
+		namespace: Dict[str, object] = {}
+		for name in self.uses[id]:
+			definers = self.definers[name]
+			if len(definers) > 1:
+				self.values[id] = {}
+				self.results[id] = f"name '{name}' is defined more than once\n"
+				return
+			for definer in definers:
+				if name in self.values.get(definer, {}):
+					namespace[name] = self.values[definer][name]
+		
+		self.results[id] = utils.run(self.code[id], namespace)
+		self.values[id] = {name: namespace[name] for name in self.defines[id] if name in namespace}
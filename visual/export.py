@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from typing import IO, Iterable, Iterator
+
+FORMATS = ["plain", "ansi", "latex"]
+
+
+
+def lines(expression, fmt: str) -> Iterator[str]:  # expression: Row
+	"""Lines of a single expression, produced lazily."""
+	if fmt == "latex":
+		yield "\\[" + "".join(expression.latex()) + "\\]"
+	elif fmt in ("plain", "ansi"):
+		yield from expression.stream(colored=fmt == "ansi")
+	else:
+		raise ValueError(f"unknown format: {fmt}")
+
+
+
+def export(expressions: Iterable, file: IO[str], fmt: str = "plain") -> None:  # expressions: Iterable[Row]
+	"""Write the expressions into the file line by line, separated by empty lines.
+	
+	Nothing but the expression being written is kept in memory, so the expressions can be loaded lazily as well.
+	"""
+	for index, expression in enumerate(expressions):
+		if index:
+			file.write("\n")
+		for line in lines(expression, fmt):
+			file.write(line)
+			file.write("\n")
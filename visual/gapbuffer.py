@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from typing import List, Optional, Union
+
+
+
+class GapBuffer:
+	"""Text with amortized O(1) inserting and deleting at the gap, which follows the last edited position.
+	
+	The characters before the gap are kept in one list and the ones after it in another one in reverse order, so
+	moving the gap by a character (the cursor moving by one) is O(1) as well. The string is built only when asked for
+	and cached until the next change.
+	"""
+	
+	def __init__(self, text: str = ""):
+		self.before: List[str] = list(text)
+		self.after: List[str] = []  # reversed
+		self.string: Optional[str] = text
+	
+	
+	def __len__(self) -> int:
+		return len(self.before) + len(self.after)
+	
+	
+	def __str__(self) -> str:
+		if self.string is None:
+			self.string = "".join(self.before) + "".join(reversed(self.after))
+		return self.string
+	
+	
+	def __getitem__(self, index: Union[int, slice]) -> str:
+		if self.string is not None or isinstance(index, int) or index.step is not None:
+			return str(self)[index]
+		
+		start, stop, _ = index.indices(len(self))
+		gap = len(self.before)
+		output = "".join(self.before[start:min(stop, gap)])
+		if stop > gap:  # the part after the gap, indices into the reversed list
+			output += "".join(reversed(self.after[max(0, len(self) - stop):len(self) - max(start, gap)]))
+		return output
+	
+	
+	def move(self, index: int) -> None:
+		"""Move the gap right before the `index`-th character."""
+		assert 0 <= index <= len(self)
+		gap = len(self.before)
+		if index < gap:
+			self.after.extend(reversed(self.before[index:]))
+			del self.before[index:]
+		elif index > gap:
+			moved = index - gap
+			self.before.extend(reversed(self.after[-moved:]))
+			del self.after[-moved:]
+	
+	
+	def insert(self, index: int, text: str) -> None:
+		self.move(index)
+		self.before.extend(text)
+		self.string = None
+	
+	
+	def delete(self, start: int, end: int) -> str:
+		"""Delete the characters from `start` to `end`, returns them."""
+		self.move(end)
+		removed = "".join(self.before[start:])
+		del self.before[start:]
+		self.string = None
+		return removed
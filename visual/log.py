@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import IO
+
+from visual import ansi
+
+LEVEL_COLORS = {
+	logging.DEBUG: ansi.yellow,
+	logging.INFO: ansi.blue,
+	logging.WARNING: ansi.red,
+	logging.ERROR: ansi.red | ansi.bold,
+	logging.CRITICAL: ansi.red | ansi.bold,
+}
+
+
+
+class ColorFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		message = super().format(record)
+		color = LEVEL_COLORS.get(record.levelno)
+		return color(message) if color else message
+
+
+
+def setup(logger: logging.Logger, level: int, stream: IO[str] = sys.stderr, background: bool = True) -> None:
+	"""Log into the stream from a background thread, so that logging never blocks on the terminal.
+	
+	Messages below `level` are dropped before they are formatted (use `%s` arguments, not f-strings). A process that
+	forks later has to log directly (`background=False`), the thread would not be forked along.
+	"""
+	logger.setLevel(level)
+	logger.propagate = False
+	
+	handler = logging.StreamHandler(stream)
+	handler.setFormatter(ColorFormatter("%(levelname)s: %(message)s"))
+	if not background:
+		logger.addHandler(handler)
+		return
+	
+	queue: SimpleQueue[logging.LogRecord] = SimpleQueue()
+	logger.addHandler(QueueHandler(queue))  # formats the message (cheap), the rest happens in the listener thread
+	listener = QueueListener(queue, handler)
+	listener.start()
+	atexit.register(listener.stop)  # flush the remaining messages
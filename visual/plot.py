@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import ast
+import builtins
+from typing import Callable, Dict, List, Optional, Tuple
+
+from visual import ansi
+
+try:
+	import numpy as np
+except ImportError:  # plotting is optional
+	np = None
+
+# names available to the plotted expressions, mapped to their vectorized versions
+FUNCTIONS = [
+	"sin", "cos", "tan", "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh",
+	"exp", "log", "log2", "log10", "sqrt", "abs", "floor", "ceil", "pi", "e",
+]
+ALIASES = {"asin": "arcsin", "acos": "arccos", "atan": "arctan"}
+
+
+
+def namespace() -> Dict[str, object]:
+	names = {name: getattr(np, name) for name in FUNCTIONS}
+	names.update({alias: getattr(np, name) for alias, name in ALIASES.items()})
+	return names
+
+
+
+def free_variables(code: str) -> List[str]:
+	"""Names used in the code that are neither builtins nor vectorized functions."""
+	compiled = compile(code, "<string>", "eval", dont_inherit=True)
+	known = set(namespace()) | set(dir(builtins))
+	return sorted(set(compiled.co_names) - known)
+
+
+
+def lambdify(code: str, variable: str) -> Callable[[np.ndarray], np.ndarray]:
+	"""Compile the code into a function of a single variable, operating on whole numpy arrays at once.
+	
+	Only the vectorized functions can be called and the builtins are not available, nothing can print, block or exit.
+	"""
+	tree = ast.parse(code, mode="eval")
+	names = namespace()
+	for node in ast.walk(tree):
+		if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in names):
+			raise ValueError(f"{ast.unparse(node.func)} is not a vectorized function")
+	compiled = compile(tree, "<string>", "eval", dont_inherit=True)
+	
+	
+	def function(values: np.ndarray) -> np.ndarray:
+		with np.errstate(all="ignore"):  # division by zero etc. produces inf/nan, which are not plotted
+			result = eval(compiled, {"__builtins__": {}}, {**names, variable: values})
+		return np.broadcast_to(np.asarray(result, dtype=float), values.shape)
+	
+	
+	return function
+
+
+
+def columns(xs: np.ndarray, ys: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+	"""Lowest and highest finite value in each column (samples are sorted by x), nan for empty columns."""
+	finite = np.isfinite(ys)
+	index = ((xs - xs[0]) / (xs[-1] - xs[0]) * width).astype(int).clip(0, width - 1)
+	starts = np.searchsorted(index, np.arange(width))
+	empty = np.diff(np.append(starts, len(xs))) == 0
+	starts = starts.clip(0, len(xs) - 1)
+	
+	lows = np.minimum.reduceat(np.where(finite, ys, np.inf), starts)
+	highs = np.maximum.reduceat(np.where(finite, ys, -np.inf), starts)
+	missing = empty | ~np.isfinite(lows)
+	lows[missing] = np.nan
+	highs[missing] = np.nan
+	return lows, highs
+
+
+
+def render(code: str, xrange: Tuple[float, float], samples: int, width: int, height: int) -> List[str]:
+	"""ASCII plot of an expression in one free variable, empty if it cannot be plotted."""
+	if np is None or width < 2 or height < 2:
+		return []
+	
+	try:
+		variables = free_variables(code)
+		if len(variables) != 1:
+			return []
+		
+		xs = np.linspace(*xrange, max(samples, width))
+		ys = lambdify(code, variables[0])(xs)
+	except Exception:
+		return []
+	
+	lows, highs = columns(xs, ys, width)
+	if np.isnan(lows).all():
+		return []
+	
+	ymin, ymax = float(np.nanmin(lows)), float(np.nanmax(highs))
+	scale = (height - 1) / (ymax - ymin) if ymax > ymin else 0.0
+	
+	
+	def to_row(y: float) -> int:
+		return height - 1 - round((y - ymin) * scale) if scale else height // 2
+	
+	
+	grid = [[" "] * width for _ in range(height)]
+	colors: List[List[Optional[ansi.Ansi]]] = [[None] * width for _ in range(height)]
+	
+	# axes
+	if ymin <= 0 <= ymax:
+		axis = to_row(0)
+		grid[axis] = ["─"] * width
+		colors[axis] = [ansi.faint] * width
+	if xrange[0] <= 0 <= xrange[1]:
+		axis = min(width - 1, int(-xrange[0] / (xrange[1] - xrange[0]) * width))
+		for r in range(height):
+			grid[r][axis] = "┼" if grid[r][axis] == "─" else "│"
+			colors[r][axis] = ansi.faint
+	
+	# the curve itself, each column spans from its lowest to its highest sample (steep parts stay connected)
+	for col, (low, high) in enumerate(zip(lows, highs)):
+		if np.isnan(low):
+			continue
+		for r in range(to_row(high), to_row(low) + 1):
+			grid[r][col] = "•"
+			colors[r][col] = None
+	
+	output = []
+	for chars, pixels in zip(grid, colors):
+		output.append("".join(pixel(ch) if pixel else ch for ch, pixel in zip(chars, pixels)))
+	
+	output[0] += f" {ymax:g}"
+	output[-1] += f" {ymin:g}"
+	output.append(f"{xrange[0]:<{width // 2}g}{xrange[1]:>{width - width // 2}g}  ({variables[0]})")
+	return output
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import json
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+# protocol: newline-delimited JSON, one response line for every request line
+# -> {"repr": "row(text(\"1\"), ...)"}  or  {"infix": "1/2 + (3)"}
+# <- {"lines": [...], "colors": [[...]], "baseline": 0, "width": 5, "code": "...", "eval": "...", "repr": "..."}
+# <- {"error": "..."}
+
+Request = Dict[str, str]
+Response = Dict[str, object]
+
+CACHE_SIZE = 4096
+TIMEOUT = 5.0  # seconds per request, the workers are restarted after that
+
+
+
+class Server:
+	def __init__(self, work: Callable[[Request], Response], workers: Optional[int] = None):
+		self.work = work  # must be picklable (a module-level function)
+		self.workers = workers
+		self.pool = self.start()
+		self.cache: OrderedDict[str, Response] = OrderedDict()  # shared by all the clients
+	
+	
+	def start(self) -> ProcessPoolExecutor:
+		# forked workers inherit the already imported (warm) interpreter, nothing is imported per request
+		return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("fork"))
+	
+	
+	def restart(self) -> None:
+		"""Replace the pool, the old workers are killed (one of them is stuck or died, the others fail their requests)."""
+		old, self.pool = self.pool, self.start()  # the new pool starts its workers only once it gets a request
+		for process in multiprocessing.active_children():
+			process.terminate()
+		old.shutdown(wait=False)  # its pending requests fail as well
+	
+	
+	async def respond(self, request: Request) -> Response:
+		key = json.dumps(request, sort_keys=True)
+		if key in self.cache:
+			self.cache.move_to_end(key)
+			return self.cache[key]
+		
+		pool = self.pool
+		try:
+			future = asyncio.get_running_loop().run_in_executor(pool, self.work, request)
+			response = await asyncio.wait_for(future, TIMEOUT)
+		except asyncio.TimeoutError:
+			if pool is self.pool:
+				self.restart()
+			return {"error": f"timed out after {TIMEOUT:g} s"}
+		except BrokenProcessPool:  # the code of a request killed its worker
+			if pool is self.pool:
+				self.restart()
+			return {"error": "worker died"}
+		
+		self.cache[key] = response
+		if len(self.cache) > CACHE_SIZE:
+			self.cache.popitem(last=False)
+		return response
+	
+	
+	async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		try:
+			while line := await reader.readline():
+				try:
+					request = json.loads(line)
+					if not isinstance(request, dict):
+						raise ValueError("request must be an object")
+					response = await self.respond(request)
+				except ValueError as e:  # json.JSONDecodeError included
+					response = {"error": f"invalid request: {e}"}
+				
+				writer.write(json.dumps(response).encode("utf8") + b"\n")
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+
+
+def loopback(host: str) -> bool:
+	if host == "localhost":
+		return True
+	try:
+		return ipaddress.ip_address(host.strip("[]")).is_loopback
+	except ValueError:
+		return False
+
+
+
+async def listen(address: str, server: Server) -> None:
+	"""`address` is either a path of a unix socket or `host:port`, only loopback hosts (the requests run code)."""
+	if ":" in address:
+		host, port = address.rsplit(":", 1)
+		host = host or "127.0.0.1"
+		if not loopback(host):
+			raise ValueError(f"refusing to listen on {host}, not a loopback address")
+		listener = await asyncio.start_server(server.handle, host.strip("[]"), int(port))
+	else:
+		listener = await asyncio.start_unix_server(server.handle, address)
+	
+	async with listener:
+		await listener.serve_forever()
+
+
+
+def serve(address: str, work: Callable[[Request], Response], workers: Optional[int] = None) -> None:
+	"""Serve the requests by `work()` in forked processes, there should be no threads running (they are not forked)."""
+	server = Server(work, workers)
+	try:
+		asyncio.run(listen(address, server))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.pool.shutdown(cancel_futures=True)
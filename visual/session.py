@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+from typing import IO, List, Sequence, Tuple
+
+from visual import ansi
+
+# session file: the first line is the initial expression, every other line is one keystroke
+# {"repr": "row(...)"}
+# {"time": 0.123, "key": "a"}
+
+
+
+class Recorder:
+	def __init__(self, path: str, initial_repr: str):
+		self.file: IO[str] = open(path, "w", encoding="utf8")
+		self.start = time.monotonic()
+		self.file.write(json.dumps({"repr": initial_repr}) + "\n")
+	
+	
+	def record(self, key: str) -> None:
+		self.file.write(json.dumps({"time": round(time.monotonic() - self.start, 6), "key": key}) + "\n")
+	
+	
+	def close(self) -> None:
+		self.file.close()
+
+
+
+def load(path: str) -> Tuple[str, List[Tuple[float, str]]]:
+	"""Returns the initial expression (as `repr`) and the timestamped keystrokes."""
+	with open(path, encoding="utf8") as f:
+		header, *lines = [json.loads(line) for line in f if line.strip()]
+	
+	return header["repr"], [(line["time"], line["key"]) for line in lines]
+
+
+
+def replay(expression, keys: Sequence[Tuple[float, str]], realtime: bool = False) -> List[float]:  # expression: Row
+	"""Feed the keystrokes to the expression, return the latency of each of them (`press_key` + `render`)."""
+	latencies = []
+	start = time.monotonic()
+	
+	for timestamp, key in keys:
+		if realtime:
+			time.sleep(max(0.0, start + timestamp - time.monotonic()))
+		
+		t = time.perf_counter()
+		expression.press_key(key)
+		expression.render()
+		latencies.append(time.perf_counter() - t)
+	
+	return latencies
+
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+	"""Nearest-rank percentile."""
+	ordered = sorted(values)
+	return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+
+def report(latencies: Sequence[float]) -> str:
+	if not latencies:
+		return "no keystrokes"
+	
+	stats = [f"p{p}: {percentile(latencies, p) * 1000:.3f} ms" for p in (50, 90, 99)]
+	stats.append(f"max: {max(latencies) * 1000:.3f} ms")
+	return f"{ansi.blue('keystrokes:')} {len(latencies)}, " + ", ".join(stats)
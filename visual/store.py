@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from typing import Iterator, Optional, Tuple
+
+# `FILE` contains the expressions (their `repr`, utf8) one after another, `FILE.idx` contains one record per expression
+RECORD = struct.Struct("<QQ")  # offset, length
+
+
+
+class Store:
+	"""On-disk archive of expressions with random access by id.
+	
+	Both files are memory-mapped, so opening takes constant time and only the accessed expressions are ever read.
+	Changed expressions are overwritten in place if they fit, otherwise they are appended (the old copy stays unused).
+	"""
+	
+	def __init__(self, path: str):
+		self.data = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+		self.index = os.open(f"{path}.idx", os.O_RDWR | os.O_CREAT, 0o644)
+		self.data_map: Optional[mmap.mmap] = None
+		self.index_map: Optional[mmap.mmap] = None
+		self.count = os.fstat(self.index).st_size // RECORD.size
+	
+	
+	def __len__(self) -> int:
+		return self.count
+	
+	
+	def __getitem__(self, id: int) -> str:
+		offset, length = self.record(id)
+		data_map = self.mapped("data", offset + length)
+		return data_map[offset:offset + length].decode("utf8")
+	
+	
+	def __setitem__(self, id: int, source: str) -> None:
+		offset, length = self.record(id)
+		encoded = source.encode("utf8")
+		if len(encoded) > length:
+			offset = os.fstat(self.data).st_size  # doesn't fit, append
+		
+		os.pwrite(self.data, encoded, offset)
+		os.pwrite(self.index, RECORD.pack(offset, len(encoded)), id * RECORD.size)
+	
+	
+	def __iter__(self) -> Iterator[str]:
+		for id in range(self.count):
+			yield self[id]
+	
+	
+	def append(self, source: str) -> int:
+		encoded = source.encode("utf8")
+		offset = os.fstat(self.data).st_size
+		os.pwrite(self.data, encoded, offset)
+		os.pwrite(self.index, RECORD.pack(offset, len(encoded)), self.count * RECORD.size)
+		self.count += 1
+		return self.count - 1
+	
+	
+	def record(self, id: int) -> Tuple[int, int]:
+		if not 0 <= id < self.count:
+			raise IndexError(f"expression {id} not found")
+		
+		index_map = self.mapped("index", (id + 1) * RECORD.size)
+		offset, length = RECORD.unpack_from(index_map, id * RECORD.size)
+		return offset, length
+	
+	
+	def mapped(self, name: str, size: int) -> mmap.mmap:
+		"""The memory map of the file, mapped again if the file grew since (writes go through the descriptor)."""
+		current: Optional[mmap.mmap] = getattr(self, f"{name}_map")
+		if current is None or len(current) < size:
+			if current is not None:
+				current.close()
+			current = mmap.mmap(getattr(self, name), 0, access=mmap.ACCESS_READ)
+			setattr(self, f"{name}_map", current)
+		return current
+	
+	
+	def close(self) -> None:
+		for m in (self.data_map, self.index_map):
+			if m is not None:
+				m.close()
+		os.close(self.data)
+		os.close(self.index)
+	
+	
+	def __enter__(self) -> Store:
+		return self
+	
+	
+	def __exit__(self, *exc: object) -> None:
+		self.close()
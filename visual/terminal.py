@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import codecs
+import os
+import termios
+from typing import List, Optional, Tuple
+
+CHUNK = 65536
+ESC = "\x1b"
+# escape sequences are read the same way as `readchar.readkey()` reads them: the characters continuing the sequence
+# at its second, third and fourth position (the fifth one always ends it)
+SEQUENCE = ["O[", "12356", "01345789"]
+
+
+
+class Keyboard:
+	"""Keys read from the terminal switched into non-canonical mode (no echo, no signals) once for the whole session.
+	
+	`readchar` switches the mode for every single character with TCSAFLUSH, which discards the input that arrived in
+	the meantime (most of a large paste). Here the input is read in chunks and split into keys, a bracketed paste
+	(`paste`, the start and end markers) is a single key.
+	"""
+	
+	def __init__(self, fd: int, paste: Tuple[str, str]):
+		self.fd = fd
+		self.paste = paste
+		self.pending = ""  # read, but not returned yet
+		self.decoder = codecs.getincrementaldecoder("utf8")(errors="replace")
+		self.saved: Optional[List[object]] = None
+	
+	
+	def setup(self) -> None:
+		self.saved = termios.tcgetattr(self.fd)
+		mode = termios.tcgetattr(self.fd)
+		mode[3] &= ~(termios.ICANON | termios.ECHO | termios.ISIG)  # CTRL_C is a key
+		mode[6][termios.VMIN] = 1
+		mode[6][termios.VTIME] = 0
+		termios.tcsetattr(self.fd, termios.TCSANOW, mode)
+	
+	
+	def restore(self) -> None:
+		if self.saved is not None:
+			termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved)
+	
+	
+	def key_length(self) -> Optional[int]:
+		"""Length of the first pending key, None if the rest of it wasn't read yet."""
+		start, end = self.paste
+		if self.pending.startswith(start):
+			index = self.pending.find(end, len(start))
+			return None if index < 0 else index + len(end)
+		if start.startswith(self.pending):
+			return None  # maybe a paste
+		
+		if self.pending[0] != ESC:
+			return 1
+		for index, continuing in enumerate(SEQUENCE, 1):
+			if len(self.pending) <= index:
+				return None
+			if self.pending[index] not in continuing:
+				return index + 1
+		return 5 if len(self.pending) >= 5 else None
+	
+	
+	def readkey(self) -> str:
+		"""The next key, blocks until the whole key (the whole paste) arrives."""
+		while not self.pending or (length := self.key_length()) is None:
+			data = os.read(self.fd, CHUNK)
+			if not data:
+				raise EOFError("end of the input")
+			self.pending += self.decoder.decode(data)
+		
+		key, self.pending = self.pending[:length], self.pending[length:]
+		return key
@@ -1,10 +1,28 @@
+import ast
+import builtins
 import contextlib
+import math
 import sys
+from collections import OrderedDict
 from io import StringIO
+from types import CodeType
+from typing import Callable, Dict, Generic, Hashable, Iterator, List, Mapping, Optional, Sequence, TypeVar
 
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
 
+# available to all the evaluated code, `math` included (see `complete`), the builtins take precedence (`pow()`)
+BUILTINS = {**{name: value for name, value in vars(math).items() if not name.startswith("_")}, **vars(builtins)}
 
-def run(code: str) -> str:
+# functions that don't print anything, the code calling only these can be evaluated in parts (see `compile_unit()`)
+PURE = {name for name in dir(math) if not name.startswith("_")} | {
+	"abs", "all", "any", "bool", "complex", "divmod", "float", "int", "len", "max", "min", "pow", "round", "sum",
+}
+
+
+
+def run(code: str, namespace: Optional[Dict[str, object]] = None) -> str:
+	"""Run the code like the interactive interpreter would, variables are read from and assigned into the namespace."""
 	@contextlib.contextmanager
 	def wrapper(stdout=None):
 		old = sys.stdout
@@ -18,8 +36,110 @@ def run(code: str) -> str:
 	with wrapper() as s:
 		try:
 			compiled = compile(code, "<string>", "single", dont_inherit=True)
-			eval(compiled, {}, {})
+			namespace = {} if namespace is None else namespace
+			namespace.setdefault("__builtins__", BUILTINS)
+			eval(compiled, namespace)
 		except Exception as e:
 			print(str(e))
 	
 	return str(s.getvalue())
+
+
+
+class Unsplittable(Exception):
+	"""The code has to be run as a whole, see `compile_unit()`."""
+
+
+
+# the nested scopes don't see the substituted names, the walrus would bind a name for the other units as well
+NESTED = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+
+def compile_unit(code: str, names: Sequence[str]) -> Optional[CodeType]:
+	"""Compile a part of an expression, in which the subexpressions (evaluated on their own) are substituted by names.
+	
+	Raises `SyntaxError`, or `Unsplittable` if the result could differ from running the code as a whole: the code calls
+	anything but the `PURE` functions (could print), assigns, has a comment (would hide the rest of the whole code) or
+	doesn't use every name exactly once outside the nested scopes. Empty code compiles to None.
+	"""
+	if not code:
+		return None
+	if "#" in code:
+		raise Unsplittable("comment")
+	
+	tree = ast.parse(code, mode="eval")
+	used: List[str] = []
+	stack = [(tree, False)]
+	while stack:
+		node, nested = stack.pop()
+		if isinstance(node, ast.NamedExpr):
+			raise Unsplittable("assignment")
+		if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in PURE):
+			raise Unsplittable(f"call of {ast.unparse(node.func)}")
+		if isinstance(node, ast.Name) and node.id in names:
+			if nested:
+				raise Unsplittable(f"{node.id} in a nested scope")
+			used.append(node.id)
+		
+		nested = nested or isinstance(node, NESTED)
+		stack.extend((child, nested) for child in ast.iter_child_nodes(node))
+	
+	if sorted(used) != sorted(names):
+		raise Unsplittable("substituted names")
+	return compile(tree, "<string>", "eval", dont_inherit=True)
+
+
+
+class Substitutions(Mapping[str, object]):
+	"""Values of the substituted names, each one is computed only once the code gets to it (like the subexpression)."""
+	
+	def __init__(self, values: Dict[str, Callable[[], object]]):
+		self.values = values
+	
+	
+	def __getitem__(self, name: str) -> object:
+		return self.values[name]()
+	
+	
+	def __iter__(self) -> Iterator[str]:
+		return iter(self.values)
+	
+	
+	def __len__(self) -> int:
+		return len(self.values)
+
+
+
+def evaluate(code: Optional[CodeType], values: Dict[str, Callable[[], object]]) -> object:
+	"""Evaluate the code compiled by `compile_unit()`, None evaluates to None.
+	
+	The names are looked up lazily, so `and`, `or` and `if` skip the subexpressions and the errors are raised in the
+	same order as if the code was run as a whole.
+	"""
+	if code is None:
+		return None
+	return eval(code, {"__builtins__": BUILTINS}, Substitutions(values))
+
+
+
+class LRU(Generic[K, V]):
+	"""Mapping that forgets the least recently used items once it is full."""
+	def __init__(self, size: int):
+		self.size = size
+		self.items: "OrderedDict[K, V]" = OrderedDict()
+	
+	
+	def get(self, key: K) -> Optional[V]:
+		value = self.items.get(key)
+		if value is not None:
+			self.items.move_to_end(key)
+		return value
+	
+	
+	def put(self, key: K, value: V) -> V:
+		self.items[key] = value
+		self.items.move_to_end(key)
+		if len(self.items) > self.size:
+			self.items.popitem(last=False)
+		return value
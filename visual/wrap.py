@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import math
+from typing import List
+
+OPERATORS = "+-*/%=<>!|&^@,"
+TIGHT = ["**", "^"]  # binding too tightly to be broken after
+
+
+
+def candidates(text: str) -> List[int]:
+	"""Positions where the text can be broken: after a binary operator and the spaces following it.
+	
+	Unary operators (after another operator, an opening paren or at the start of the text) and the `TIGHT` ones are
+	never broken after.
+	"""
+	output = []
+	previous = ""  # last non-space character
+	index = 0
+	while index < len(text):
+		char = text[index]
+		if char in OPERATORS and previous and previous not in OPERATORS and previous not in "([{":
+			start = index
+			index += 1
+			while index < len(text) and text[index] in OPERATORS and text[index] != ",":  # **, ==, <=, ...
+				index += 1
+			operator = text[start:index]
+			previous = text[index - 1]
+			while index < len(text) and text[index] == " ":
+				index += 1
+			if operator not in TIGHT:
+				output.append(index)
+			continue
+		
+		if char != " ":
+			previous = char
+		index += 1
+	return output
+
+
+
+class LineBreaker:
+	"""Minimum raggedness line breaking of pieces with the given widths (the sum of the squared trailing spaces).
+	
+	The best breaks of a prefix depend only on the widths of the pieces in it, so the table is kept between the calls
+	and recomputed only from the first piece whose width changed (the edited one). The last line is not penalized.
+	"""
+	
+	def __init__(self) -> None:
+		self.width = -1
+		self.widths: List[int] = []
+		self.cost: List[float] = [0]  # the best cost of the pieces before `j`, if a line ends right before `j`
+		self.start: List[int] = [0]  # the first piece of the line ending right before `j` in that solution
+	
+	
+	def best_line(self, widths: List[int], end: int, width: int, last: bool = False) -> int:
+		"""The start of the line ending right before `end` in the best solution, updates the table if not `last`."""
+		best, best_start = math.inf, end - 1
+		length = widest = 0
+		for start in range(end - 1, -1, -1):
+			length += widths[start]
+			widest = max(widest, widths[start])
+			if length > width and length > widest:  # only a single (non-empty) piece can be wider than the line
+				break
+			
+			cost = self.cost[start] + (0 if last or length > width else (width - length) ** 2)
+			if cost <= best:  # prefer fewer (longer) lines
+				best, best_start = cost, start
+		
+		if not last:
+			self.cost.append(best)
+			self.start.append(best_start)
+		return best_start
+	
+	
+	def breaks(self, widths: List[int], width: int) -> List[int]:
+		"""Indices of the pieces starting a new line (except the first line)."""
+		if width != self.width:
+			self.width, self.widths, self.cost, self.start = width, [], [0], [0]
+		
+		same = 0
+		for old, new in zip(self.widths, widths):
+			if old != new:
+				break
+			same += 1
+		
+		self.widths = list(widths)
+		del self.cost[same + 1:], self.start[same + 1:]
+		for end in range(same + 1, len(widths) + 1):
+			self.best_line(widths, end, width)
+		
+		output = []
+		start = self.best_line(widths, len(widths), width, last=True) if widths else 0
+		while start > 0:
+			output.append(start)
+			start = self.start[start]
+		return output[::-1]